@@ -0,0 +1,205 @@
+#!/usr/bin/env python3
+# bench_mqtt_led.py
+# Drives N commands/s through the MQTT LED path without a Pi or a real broker:
+#   sender -> broker stand-in -> GpioRouter (fake GPIO) -> status -> sender
+# and reports throughput plus p50/p99 round-trip latency.
+#
+#   python3 bench_mqtt_led.py --rate 200 --count 2000 --devices 8 --hop-ms 1
+
+import argparse
+import heapq
+import itertools
+import json
+import threading
+import time
+
+from gpio_router import GpioRouter, CONTROL_TOPIC, STATUS_TOPIC
+from latency import LatencyHistogram
+
+
+# -------------------------
+# FAKE GPIO
+# -------------------------
+class FakePWM:
+    def __init__(self, gpio, pin):
+        self.gpio = gpio
+        self.pin = pin
+
+    def start(self, duty):
+        pass
+
+    def ChangeDutyCycle(self, duty):
+        self.gpio.writes += 1
+
+    def stop(self):
+        pass
+
+
+class FakeGPIO:
+    OUT = 0
+    IN = 1
+
+    def __init__(self):
+        self.writes = 0
+
+    def setup(self, pin, mode):
+        pass
+
+    def output(self, pin, value):
+        self.writes += 1
+
+    def PWM(self, pin, freq):
+        return FakePWM(self, pin)
+
+
+# -------------------------
+# BROKER STAND-IN
+# -------------------------
+def topic_matches(pattern, topic):
+    p, t = pattern.split("/"), topic.split("/")
+    for i, level in enumerate(p):
+        if level == "#":
+            return True
+        if i >= len(t) or (level != "+" and level != t[i]):
+            return False
+    return len(p) == len(t)
+
+
+class PublishInfo:
+    # enough of paho's MQTTMessageInfo for the router / outbox
+    rc = 0
+
+    def is_published(self):
+        return True
+
+
+class FakeBroker:
+    """
+    In-process broker: one delivery thread, messages are handed to matching
+    subscribers `hop` seconds after publish (simulated network + broker time).
+    """
+
+    def __init__(self, hop=0.0):
+        self.hop = hop
+        self.subs = []
+        self.messages = 0
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def subscribe(self, pattern, callback):
+        self.subs.append((pattern, callback))
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        with self._cond:
+            heapq.heappush(self._heap, (time.monotonic() + self.hop, next(self._seq), topic, payload))
+            self._cond.notify()
+        return PublishInfo()
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        self._thread.join()
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while self._running and (not self._heap or self._heap[0][0] > time.monotonic()):
+                    timeout = self._heap[0][0] - time.monotonic() if self._heap else None
+                    self._cond.wait(timeout)
+                if not self._running:
+                    return
+                _, _, topic, payload = heapq.heappop(self._heap)
+            self.messages += 1
+            for pattern, callback in self.subs:
+                if topic_matches(pattern, topic):
+                    callback(topic, payload)
+
+
+# -------------------------
+# BENCHMARK
+# -------------------------
+def run(rate, count, devices, hop, window, pwm, timeout):
+    broker = FakeBroker(hop)
+    gpio = FakeGPIO()
+    table = {f"dev{i}": {"pin": i + 2, "pwm": pwm} for i in range(devices)}
+    router = GpioRouter(table, gpio, broker.publish, window=window)
+    for pattern, _ in router.subscriptions():
+        broker.subscribe(pattern, router.handle)
+
+    rtt = LatencyHistogram("round trip")
+    sent = {}
+    done = threading.Event()
+    lock = threading.Lock()
+    last_ack = [0.0]
+
+    def on_status(topic, payload):
+        now = time.monotonic()
+        if not payload.startswith("{"):
+            return
+        with lock:
+            for cmd_id in json.loads(payload)["ids"]:
+                start = sent.pop(cmd_id, None)
+                if start is not None:
+                    rtt.record(now - start)
+            last_ack[0] = now
+            if rtt.count == count:
+                done.set()
+
+    broker.subscribe(STATUS_TOPIC.format(name="+"), on_status)
+
+    # open loop: command i goes out at start + i / rate, whatever the replies do
+    names = list(table)
+    start = time.monotonic()
+    for i in range(count):
+        delay = start + i / rate - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        name = names[i % len(names)]
+        if pwm:
+            cmd = str((i * 7) % 101)
+        else:
+            cmd = "ON" if (i // len(names)) % 2 == 0 else "OFF"
+        cmd_id = str(i)
+        with lock:
+            sent[cmd_id] = time.monotonic()
+        broker.publish(CONTROL_TOPIC.format(name=name),
+                       json.dumps({"cmd": cmd, "id": cmd_id, "ts": int(time.time() * 1000)}))
+    send_end = time.monotonic()
+
+    done.wait(timeout)
+    broker.stop()
+    router.cleanup()
+
+    elapsed = max(last_ack[0], send_end) - start
+    print("======= MQTT LED PATH BENCHMARK =======")
+    print(f"Devices: {devices} ({'PWM' if pwm else 'ON/OFF'})  hop: {hop * 1000:.1f} ms  window: {window * 1000:.1f} ms")
+    print(f"Commands sent: {count} at {count / (send_end - start):.0f}/s (target {rate}/s)")
+    print(f"Acknowledged: {rtt.count}  lost: {len(sent)}")
+    print(f"Throughput: {rtt.count / elapsed:.0f} commands/s")
+    print(f"GPIO writes: {gpio.writes}  broker messages: {broker.messages}")
+    if rtt.count:
+        print(f"Round trip p50: {rtt.percentile(50) * 1000:.2f} ms  "
+              f"p99: {rtt.percentile(99) * 1000:.2f} ms  max: {rtt.max * 1000:.2f} ms")
+    print("---- device side ----")
+    print(router.latency_summary())
+    print("========================================")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the MQTT -> GPIO -> status path")
+    parser.add_argument("--rate", type=float, default=200, help="commands per second")
+    parser.add_argument("--count", type=int, default=2000, help="number of commands")
+    parser.add_argument("--devices", type=int, default=8, help="number of pins")
+    parser.add_argument("--hop-ms", type=float, default=1.0, help="one-way broker delay")
+    parser.add_argument("--window-ms", type=float, default=20.0, help="router coalescing window")
+    parser.add_argument("--pwm", action="store_true", help="send brightness values to PWM pins")
+    parser.add_argument("--timeout", type=float, default=10.0, help="seconds to wait for replies")
+    args = parser.parse_args()
+
+    run(args.rate, args.count, args.devices, args.hop_ms / 1000.0,
+        args.window_ms / 1000.0, args.pwm, args.timeout)
@@ -0,0 +1,251 @@
+"""
+Table-driven MQTT -> GPIO command router.
+
+Every device in the table gets its own control/status topic built from a
+template, e.g. "umesh/{name}/control".  The router subscribes once with the
+"+" wildcard and finds the handler for an incoming topic with a dict lookup.
+
+Commands that arrive within `window` seconds are coalesced: only the last
+command per pin is applied, the GPIO is only written when the value really
+changes, and the changed statuses are published together after the window.
+
+    DEVICES = {
+        "led":   {"pin": 26},
+        "relay": {"pin": 5},
+        "lamp":  {"pin": 12, "pwm": True, "freq": 1000},
+    }
+
+Commands: "ON", "OFF", or a brightness 0-100 for PWM devices.  A command
+can also be sent as JSON to get latency tracking:
+
+    {"cmd": "ON", "id": "a1b2", "ts": 1712345678901}    (ts = sender ms epoch)
+
+The status for such a command is always published (even without a change)
+and echoes the correlation ids so the sender can match it up:
+
+    {"state": "ON", "ids": ["a1b2"], "ts": 1712345678901, "device_ms": 20.4}
+
+device_ms is the time from receiving the first merged command until the
+status is handed to publish.  A missing or non-numeric ts is left out.
+"""
+
+import json
+import threading
+import time
+
+from latency import LatencyHistogram
+
+CONTROL_TOPIC = "umesh/{name}/control"
+STATUS_TOPIC = "umesh/{name}/status"
+
+
+# -------------------------
+# PIN HANDLERS
+# -------------------------
+class DigitalPin:
+    def __init__(self, gpio, pin):
+        self.gpio = gpio
+        self.pin = pin
+        self.value = 0
+        gpio.setup(pin, gpio.OUT)
+        gpio.output(pin, False)
+
+    def parse(self, command):
+        if command == "ON":
+            return 100
+        if command == "OFF":
+            return 0
+        return None
+
+    def write(self, value):
+        self.gpio.output(self.pin, value > 0)
+        self.value = value
+
+    def status(self):
+        return "ON" if self.value else "OFF"
+
+    def stop(self):
+        self.gpio.output(self.pin, False)
+
+
+class PwmPin(DigitalPin):
+    def __init__(self, gpio, pin, freq=1000):
+        super().__init__(gpio, pin)
+        self.pwm = gpio.PWM(pin, freq)
+        self.pwm.start(0)
+
+    def parse(self, command):
+        value = super().parse(command)
+        if value is not None:
+            return value
+        try:
+            return max(0.0, min(100.0, float(command)))
+        except ValueError:
+            return None
+
+    def write(self, value):
+        self.pwm.ChangeDutyCycle(value)
+        self.value = value
+
+    def status(self):
+        if self.value == 0:
+            return "OFF"
+        if self.value == 100:
+            return "ON"
+        return f"{self.value:g}"
+
+    def stop(self):
+        self.pwm.stop()
+
+
+# -------------------------
+# ROUTER
+# -------------------------
+class GpioRouter:
+    def __init__(self, devices, gpio, publish, control_topic=CONTROL_TOPIC,
+                 status_topic=STATUS_TOPIC, window=0.02, qos=1):
+        """
+        devices : {name: {"pin": int, "pwm": bool, "freq": int}}
+        gpio    : RPi.GPIO (or anything with the same API)
+        publish : callable(topic, payload, qos=...), e.g. client.publish or outbox.publish
+        """
+        self.publish = publish
+        self.control_topic = control_topic
+        self.window = window
+        self.qos = qos
+
+        self.handlers = {}       # control topic -> (name, handler)
+        self.status_topics = {}  # name -> status topic
+        pins = {}                # pin -> name, coalescing is per pin
+        for name, conf in devices.items():
+            if "/" in name or "+" in name or "#" in name:
+                raise ValueError(f"invalid device name: {name!r}")
+            if conf["pin"] in pins:
+                raise ValueError(f"pin {conf['pin']} used by both {pins[conf['pin']]!r} and {name!r}")
+            pins[conf["pin"]] = name
+            if conf.get("pwm"):
+                handler = PwmPin(gpio, conf["pin"], conf.get("freq", 1000))
+            else:
+                handler = DigitalPin(gpio, conf["pin"])
+            self.handlers[control_topic.format(name=name)] = (name, handler)
+            self.status_topics[name] = status_topic.format(name=name)
+
+        self._lock = threading.Lock()
+        self._pending = {}   # name -> [handler, value, ts, [(id, received), ...]], last command wins
+        self._timer = None
+        # held for the whole apply + publish step so flushes never overlap and
+        # statuses go out in the same order the pins were written
+        self._flush_lock = threading.Lock()
+
+        # device side latency, measured from the `received` time given to handle()
+        self.latency = {
+            "apply": LatencyHistogram("receive->gpio"),
+            "status": LatencyHistogram("receive->status"),
+            "inbound": LatencyHistogram("sender->receive"),  # needs synced clocks
+        }
+
+    def subscriptions(self):
+        return [(self.control_topic.format(name="+"), self.qos)]
+
+    def handle(self, topic, command, received=None):
+        """
+        Queue a command; returns False if the topic or command is unknown.
+        `received` is the time.monotonic() of message arrival; pass it from
+        on_message so decoding/logging there is counted, else the clock starts here.
+        """
+        if received is None:
+            received = time.monotonic()
+        entry = self.handlers.get(topic)
+        if entry is None:
+            return False
+        name, handler = entry
+
+        cmd_id, sent_ts = None, None
+        if command.lstrip().startswith("{"):
+            try:
+                data = json.loads(command)
+                cmd_id, sent_ts = data.get("id"), data.get("ts")
+                command = str(data["cmd"])
+            except (ValueError, KeyError, AttributeError, TypeError):
+                print("Ignoring command for", name, ":", command)
+                return False
+            # ts is optional; a bad one only costs the latency sample
+            if isinstance(sent_ts, bool) or not isinstance(sent_ts, (int, float)):
+                sent_ts = None
+
+        value = handler.parse(command.strip().upper())
+        if value is None:
+            print("Ignoring command for", name, ":", command)
+            return False
+
+        if sent_ts is not None:
+            delay = time.time() - sent_ts / 1000.0
+            if delay >= 0:
+                self.latency["inbound"].record(delay)
+
+        with self._lock:
+            slot = self._pending.get(name)
+            if slot is None:
+                slot = self._pending[name] = [handler, value, sent_ts, []]
+            else:
+                slot[1], slot[2] = value, sent_ts
+            slot[3].append((cmd_id, received))
+            if self._timer is None:
+                self._timer = threading.Timer(self.window, self.flush)
+                self._timer.daemon = True
+                self._timer.start()
+        return True
+
+    def flush(self):
+        """Apply pending commands and publish statuses that changed or carry ids."""
+        with self._flush_lock:
+            with self._lock:
+                pending = self._pending
+                self._pending = {}
+                self._timer = None
+            self._apply(pending)
+
+    def _apply(self, pending):
+        # caller holds self._flush_lock
+        replies = []
+        for name, (handler, value, sent_ts, commands) in pending.items():
+            changed = value != handler.value
+            if changed:
+                handler.write(value)
+                # only the last command per pin caused the write
+                self.latency["apply"].record(time.monotonic() - commands[-1][1])
+            ids = [cmd_id for cmd_id, _ in commands if cmd_id is not None]
+            if changed or ids:
+                replies.append((name, handler, sent_ts, commands, ids))
+
+        for name, handler, sent_ts, commands, ids in replies:
+            if ids:
+                payload = json.dumps({
+                    "state": handler.status(),
+                    "ids": ids,
+                    "ts": sent_ts,
+                    "device_ms": round((time.monotonic() - commands[0][1]) * 1000, 3),
+                })
+            else:
+                payload = handler.status()
+            self.publish(self.status_topics[name], payload, qos=self.qos)
+            published = time.monotonic()
+            for _, received in commands:
+                self.latency["status"].record(published - received)
+
+    def publish_all(self):
+        with self._flush_lock:
+            for name, handler in self.handlers.values():
+                self.publish(self.status_topics[name], handler.status(), qos=self.qos)
+
+    def latency_summary(self):
+        return "\n".join(h.summary() for h in self.latency.values())
+
+    def cleanup(self):
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        with self._flush_lock:
+            for name, handler in self.handlers.values():
+                handler.stop()
@@ -0,0 +1,61 @@
+"""
+Constant-memory latency histogram for long running scripts on the Pi.
+
+Buckets are log-scaled (50 per decade, ~5% wide) from 10 us to 100 s, so
+percentiles are accurate to about one bucket without keeping every sample.
+"""
+
+import math
+import threading
+
+
+class LatencyHistogram:
+    def __init__(self, name, min_s=1e-5, max_s=100.0, buckets_per_decade=50):
+        self.name = name
+        self.min_s = min_s
+        self.buckets_per_decade = buckets_per_decade
+        size = int(math.ceil(math.log10(max_s / min_s) * buckets_per_decade)) + 1
+        self.buckets = [0] * size
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self._lock = threading.Lock()
+
+    def _index(self, seconds):
+        if seconds <= self.min_s:
+            return 0
+        i = int(math.log10(seconds / self.min_s) * self.buckets_per_decade) + 1
+        return min(i, len(self.buckets) - 1)
+
+    def _upper(self, index):
+        return self.min_s * 10 ** (index / self.buckets_per_decade)
+
+    def record(self, seconds):
+        with self._lock:
+            self.buckets[self._index(seconds)] += 1
+            self.count += 1
+            self.total += seconds
+            if seconds > self.max:
+                self.max = seconds
+
+    def percentile(self, p):
+        """Upper edge of the bucket holding the p-th percentile (0-100), in seconds."""
+        with self._lock:
+            if self.count == 0:
+                return None
+            rank = max(1, int(math.ceil(self.count * p / 100.0)))
+            seen = 0
+            for i, n in enumerate(self.buckets):
+                seen += n
+                if seen >= rank:
+                    return min(self._upper(i), self.max)
+        return self.max
+
+    def summary(self):
+        if self.count == 0:
+            return f"{self.name}: no samples"
+        return (f"{self.name}: n={self.count} "
+                f"avg={self.total / self.count * 1000:.2f}ms "
+                f"p50={self.percentile(50) * 1000:.2f}ms "
+                f"p99={self.percentile(99) * 1000:.2f}ms "
+                f"max={self.max * 1000:.2f}ms")
@@ -1,14 +1,23 @@
+import os
+import time
 import paho.mqtt.client as mqtt
 import RPi.GPIO as GPIO
+from mqtt_queue import DiskQueue, StoreAndForward
+from gpio_router import GpioRouter
 
 # ---------------- GPIO ----------------
 LED_PIN = 26
 GPIO.setwarnings(False)
 GPIO.setmode(GPIO.BCM)
-GPIO.setup(LED_PIN, GPIO.OUT)
-GPIO.output(LED_PIN, False)
 
-led_state = "OFF"
+# one entry per relay / LED; each gets umesh/<name>/control and umesh/<name>/status
+# add "pwm": True (and optionally "freq") for brightness control (0-100)
+DEVICES = {
+    "led": {"pin": LED_PIN},
+}
+
+# commands arriving within this many seconds are merged (last one per pin wins)
+COALESCE_WINDOW = 0.02
 
 # ---------------- MQTT ----------------
 BROKER = "YOUR_HIVEMQ_HOST"
@@ -16,30 +25,33 @@ PORT = 8883
 USERNAME = "YOUR_USERNAME"
 PASSWORD = "YOUR_PASSWORD"
 
-TOPIC_CONTROL = "umesh/led/control"
-TOPIC_STATUS  = "umesh/led/status"
+TOPIC_CONTROL = "umesh/{name}/control"
+TOPIC_STATUS  = "umesh/{name}/status"
+STATUS_QOS = 1
+
+# outgoing messages are kept here while the broker is unreachable
+OUTBOX_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "mqtt_outbox")
 
 def on_connect(client, userdata, flags, rc):
     print("MQTT connect result code:", rc)
     if rc == 0:
         print("Connected to MQTT Broker")
-        client.subscribe(TOPIC_CONTROL)
-        client.publish(TOPIC_STATUS, led_state)
+        client.subscribe(router.subscriptions())
+        outbox.on_connect()
+        router.publish_all()
+
+def on_disconnect(client, userdata, rc):
+    print("MQTT disconnected, result code:", rc)
+    outbox.on_disconnect()
 
 def on_message(client, userdata, msg):
-    global led_state
+    received = time.monotonic()
     command = msg.payload.decode()
-    print("Received:", command)
+    print("Received:", msg.topic, command)
+    router.handle(msg.topic, command, received)
 
-    if command == "ON" and led_state == "OFF":
-        GPIO.output(LED_PIN, True)
-        led_state = "ON"
-        client.publish(TOPIC_STATUS, "ON")
-
-    elif command == "OFF" and led_state == "ON":
-        GPIO.output(LED_PIN, False)
-        led_state = "OFF"
-        client.publish(TOPIC_STATUS, "OFF")
+outbox = None
+router = None
 
 try:
     client = mqtt.Client()
@@ -48,14 +60,27 @@ try:
 
     client.on_connect = on_connect
     client.on_message = on_message
+    client.on_disconnect = on_disconnect
+    client.reconnect_delay_set(min_delay=1, max_delay=60)
+
+    outbox = StoreAndForward(client, DiskQueue(OUTBOX_DIR))
+    router = GpioRouter(DEVICES, GPIO, outbox.publish,
+                        control_topic=TOPIC_CONTROL, status_topic=TOPIC_STATUS,
+                        window=COALESCE_WINDOW, qos=STATUS_QOS)
 
+    # keep retrying instead of failing when the uplink is down at start
     print("Connecting to broker...")
-    client.connect(BROKER, PORT, 60)
-    client.loop_forever()
+    client.connect_async(BROKER, PORT, 60)
+    client.loop_forever(retry_first_connection=True)
 
 except KeyboardInterrupt:
     print("KeyboardInterrupt...")
 
 finally:
+    if router is not None:
+        print(router.latency_summary())
+        router.cleanup()
+    if outbox is not None:
+        outbox.queue.close()
     GPIO.cleanup()
     print("Exiting from System")
@@ -0,0 +1,360 @@
+"""
+Store-and-forward outbox for MQTT publishing.
+
+Messages that cannot be sent right now (broker unreachable, uplink down)
+are appended to segment files on disk and replayed in order once the
+client reconnects.  Works with any paho-style client, so the same outbox
+can carry LED status, HC-SR04 alerts or GPS fixes.
+
+    outbox = StoreAndForward(client, DiskQueue("mqtt_outbox"))
+    client.on_connect    -> call outbox.on_connect()
+    client.on_disconnect -> call outbox.on_disconnect()
+    outbox.publish("umesh/led/status", "ON", qos=1)
+"""
+
+import base64
+import json
+import os
+import threading
+import time
+
+# same value as paho.mqtt.client.MQTT_ERR_SUCCESS
+MQTT_ERR_SUCCESS = 0
+
+SEGMENT_SUFFIX = ".seg"
+CURSOR_FILE = "cursor"
+
+
+# -------------------------
+# DISK QUEUE
+# -------------------------
+class DiskQueue:
+    """
+    Append-only queue made of numbered segment files.
+
+    - one JSON record per line, a torn last line (power cut) is dropped on open
+    - fsync is batched: every `fsync_every` records or `fsync_interval` seconds
+    - total size is bounded by `max_bytes`; when full the oldest segment is dropped
+      and the number of unsent records lost is added to `dropped`
+    - the read position (cursor) is stored in its own file and only moves on commit()
+    """
+
+    def __init__(self, directory, segment_bytes=256 * 1024, max_bytes=8 * 1024 * 1024,
+                 fsync_every=32, fsync_interval=1.0):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.fsync_every = fsync_every
+        self.fsync_interval = fsync_interval
+        self.dropped = 0
+
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+        self._segments = sorted(
+            int(name[:-len(SEGMENT_SUFFIX)])
+            for name in os.listdir(directory)
+            if name.endswith(SEGMENT_SUFFIX)
+        )
+        if not self._segments:
+            self._segments = [0]
+        self._repair_tail(self._segments[-1])
+        self._sizes = {}
+        for seg in self._segments:
+            path = self._path(seg)
+            self._sizes[seg] = os.path.getsize(path) if os.path.exists(path) else 0
+
+        self._cursor = self._load_cursor()
+        self._file = open(self._path(self._segments[-1]), "ab")
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+        self._sync_timer = None
+
+    # ---------- helpers ----------
+    def _path(self, seg):
+        return os.path.join(self.directory, f"{seg:08d}{SEGMENT_SUFFIX}")
+
+    def _repair_tail(self, seg):
+        # cut a half-written last record left behind by a crash
+        path = self._path(seg)
+        if not os.path.exists(path):
+            return
+        with open(path, "rb+") as f:
+            data = f.read()
+            if data and not data.endswith(b"\n"):
+                f.truncate(data.rfind(b"\n") + 1)
+
+    def _load_cursor(self):
+        try:
+            with open(os.path.join(self.directory, CURSOR_FILE), "r") as f:
+                seg, offset = (int(x) for x in f.read().split())
+        except (OSError, ValueError):
+            return (self._segments[0], 0)
+        if seg not in self._sizes:
+            return (self._segments[0], 0)
+        return (seg, min(offset, self._sizes[seg]))
+
+    def _save_cursor(self):
+        path = os.path.join(self.directory, CURSOR_FILE)
+        tmp = path + ".tmp"
+        with open(tmp, "w") as f:
+            f.write(f"{self._cursor[0]} {self._cursor[1]}")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, path)
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+        self._last_sync = time.monotonic()
+
+    def _roll(self):
+        self._sync()
+        self._file.close()
+        seg = self._segments[-1] + 1
+        self._segments.append(seg)
+        self._sizes[seg] = 0
+        self._file = open(self._path(seg), "ab")
+
+    def _timed_sync(self):
+        # makes sure a burst shorter than fsync_every still reaches the disk
+        with self._lock:
+            self._sync_timer = None
+            if self._unsynced and not self._file.closed:
+                self._sync()
+
+    def _drop_oldest(self):
+        seg = self._segments.pop(0)
+        start = self._cursor[1] if self._cursor[0] == seg else 0
+        with open(self._path(seg), "rb") as f:
+            f.seek(start)
+            lost = f.read().count(b"\n")
+        os.remove(self._path(seg))
+        del self._sizes[seg]
+        if self._cursor[0] <= seg:
+            self.dropped += lost
+            self._cursor = (self._segments[0], 0)
+            self._save_cursor()
+            print("MQTT outbox full, dropped", lost, "unsent messages")
+
+    # ---------- public API ----------
+    def append(self, topic, payload, qos=0, retain=False):
+        record = {"topic": topic, "qos": qos, "retain": retain, "ts": time.time()}
+        if isinstance(payload, (bytes, bytearray)):
+            record["payload_b64"] = base64.b64encode(payload).decode("ascii")
+        else:
+            record["payload"] = payload
+        line = (json.dumps(record, separators=(",", ":")) + "\n").encode("utf-8")
+
+        with self._lock:
+            active = self._segments[-1]
+            if self._sizes[active] and self._sizes[active] + len(line) > self.segment_bytes:
+                self._roll()
+                active = self._segments[-1]
+            while len(self._segments) > 1 and sum(self._sizes.values()) + len(line) > self.max_bytes:
+                self._drop_oldest()
+
+            self._file.write(line)
+            self._file.flush()
+            self._sizes[active] += len(line)
+            self._unsynced += 1
+            if (self._unsynced >= self.fsync_every
+                    or time.monotonic() - self._last_sync >= self.fsync_interval):
+                self._sync()
+            elif self._sync_timer is None:
+                self._sync_timer = threading.Timer(self.fsync_interval, self._timed_sync)
+                self._sync_timer.daemon = True
+                self._sync_timer.start()
+
+    def empty(self):
+        with self._lock:
+            seg, offset = self._cursor
+            return seg == self._segments[-1] and offset >= self._sizes[seg]
+
+    def peek(self, limit):
+        """
+        Return up to `limit` unsent records as (record, position) pairs.
+        Pass a position to commit() once that record has been delivered.
+        """
+        out = []
+        with self._lock:
+            seg, offset = self._cursor
+            for s in self._segments:
+                if s < seg:
+                    continue
+                start = offset if s == seg else 0
+                if start >= self._sizes[s]:
+                    continue
+                with open(self._path(s), "rb") as f:
+                    f.seek(start)
+                    pos = start
+                    while len(out) < limit and pos < self._sizes[s]:
+                        line = f.readline()
+                        if not line.endswith(b"\n"):
+                            break
+                        pos += len(line)
+                        record = json.loads(line)
+                        if "payload_b64" in record:
+                            record["payload"] = base64.b64decode(record.pop("payload_b64"))
+                        out.append((record, (s, pos)))
+                if len(out) >= limit:
+                    break
+        return out
+
+    def commit(self, position):
+        """Mark everything up to `position` as delivered and free old segments."""
+        with self._lock:
+            if position <= self._cursor:
+                return
+            seg, offset = position
+            # a fully read segment that is not the active one can go
+            while seg != self._segments[-1] and offset >= self._sizes[seg]:
+                seg, offset = self._segments[self._segments.index(seg) + 1], 0
+            self._cursor = (seg, offset)
+            while self._segments[0] < seg:
+                done = self._segments.pop(0)
+                os.remove(self._path(done))
+                del self._sizes[done]
+            self._save_cursor()
+
+    def sync(self):
+        with self._lock:
+            self._sync()
+
+    def close(self):
+        with self._lock:
+            if self._sync_timer is not None:
+                self._sync_timer.cancel()
+                self._sync_timer = None
+            self._sync()
+            self._file.close()
+
+
+# -------------------------
+# STORE AND FORWARD PUBLISHER
+# -------------------------
+class StoreAndForward:
+    """
+    Wraps a paho client.  While connected and the outbox is empty, publish()
+    goes straight to the client; otherwise messages are queued on disk and
+    replayed in order by a background thread after on_connect().
+
+    QoS is kept per message.  A replayed QoS 1/2 message is only committed
+    once the broker acknowledged it, so a drop mid-replay resends it on the
+    next connect (at-least-once).  QoS 0 messages are committed as soon as
+    the client accepted them.
+
+    If a replay stops while still connected (ack timeout, quick reconnect)
+    it is retried after `retry_delay` seconds, doubling up to `max_retry_delay`.
+    """
+
+    def __init__(self, client, queue, rate=50.0, batch=20, ack_timeout=10.0,
+                 retry_delay=1.0, max_retry_delay=60.0):
+        self.client = client
+        self.queue = queue
+        self.rate = rate              # max replayed messages per second
+        self.batch = batch            # records read from disk per round
+        self.ack_timeout = ack_timeout
+        self.retry_delay = retry_delay
+        self.max_retry_delay = max_retry_delay
+
+        self._backoff = retry_delay
+        self._lock = threading.Lock()
+        self._connected = False
+        self._flushing = False
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        with self._lock:
+            direct = self._connected and not self._flushing and self.queue.empty()
+            if not direct:
+                self._enqueue(topic, payload, qos, retain)
+                return
+
+        # not under self._lock: paho may call on_disconnect from inside publish()
+        info = self.client.publish(topic, payload, qos, retain)
+        if info.rc == MQTT_ERR_SUCCESS:
+            return
+        with self._lock:
+            self._enqueue(topic, payload, qos, retain)
+
+    def on_connect(self):
+        with self._lock:
+            self._connected = True
+            self._start_flush()
+
+    def on_disconnect(self):
+        with self._lock:
+            self._connected = False
+
+    def _enqueue(self, topic, payload, qos, retain):
+        # caller holds self._lock
+        self.queue.append(topic, payload, qos, retain)
+        if self._connected:
+            self._start_flush()
+
+    def _start_flush(self):
+        # caller holds self._lock
+        if self._flushing or self.queue.empty():
+            return
+        self._flushing = True
+        threading.Thread(target=self._flush, daemon=True).start()
+
+    def _retry(self):
+        with self._lock:
+            if self._connected:
+                self._start_flush()
+
+    def _wait_ack(self, info):
+        deadline = time.monotonic() + self.ack_timeout
+        while not info.is_published():
+            if time.monotonic() >= deadline or not self._connected:
+                return False
+            time.sleep(0.01)
+        return True
+
+    def _flush(self):
+        while True:
+            with self._lock:
+                batch = self.queue.peek(self.batch) if self._connected else []
+                if not batch:
+                    self._flushing = False
+                    if self._connected:
+                        self._backoff = self.retry_delay
+                    return
+
+            started = time.monotonic()
+            sent = []
+            for record, position in batch:
+                info = self.client.publish(record["topic"], record["payload"],
+                                           record["qos"], record["retain"])
+                if info.rc != MQTT_ERR_SUCCESS:
+                    break
+                sent.append((info, record["qos"], position))
+
+            committed = None
+            for info, qos, position in sent:
+                if qos > 0 and not self._wait_ack(info):
+                    break
+                committed = position
+            if committed is not None:
+                self.queue.commit(committed)
+
+            if committed is None or committed != batch[-1][1]:
+                with self._lock:
+                    self._flushing = False
+                    if not self._connected:
+                        print("MQTT outbox replay interrupted, will retry on reconnect")
+                        return
+                    delay = self._backoff
+                    self._backoff = min(self._backoff * 2, self.max_retry_delay)
+                print(f"MQTT outbox replay interrupted, retrying in {delay:g}s")
+                timer = threading.Timer(delay, self._retry)
+                timer.daemon = True
+                timer.start()
+                return
+
+            # rate control: spread each batch over len(batch) / rate seconds
+            delay = len(batch) / self.rate - (time.monotonic() - started)
+            if delay > 0:
+                time.sleep(delay)
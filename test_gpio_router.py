@@ -0,0 +1,159 @@
+import json
+import threading
+import time
+
+import pytest
+
+from gpio_router import GpioRouter
+
+
+# -------------------------
+# FAKE GPIO
+# -------------------------
+class FakePWM:
+    def __init__(self):
+        self.duty = 0
+
+    def start(self, duty):
+        self.duty = duty
+
+    def ChangeDutyCycle(self, duty):
+        self.duty = duty
+
+    def stop(self):
+        pass
+
+
+class FakeGPIO:
+    OUT = 0
+
+    def __init__(self):
+        self.pins = {}
+        self.writes = 0
+        self.pwms = {}
+
+    def setup(self, pin, mode):
+        self.pins[pin] = False
+
+    def output(self, pin, value):
+        self.pins[pin] = value
+        self.writes += 1
+
+    def PWM(self, pin, freq):
+        self.pwms[pin] = FakePWM()
+        return self.pwms[pin]
+
+
+class Recorder:
+    def __init__(self, slow_payload=None, delay=0.0):
+        self.published = []
+        self.slow_payload = slow_payload
+        self.delay = delay
+        self.lock = threading.Lock()
+
+    def __call__(self, topic, payload, qos=0):
+        if payload == self.slow_payload:
+            time.sleep(self.delay)
+        with self.lock:
+            self.published.append((topic, payload))
+
+
+def make_router(publish, window=0.01, **devices):
+    gpio = FakeGPIO()
+    router = GpioRouter(devices or {"led": {"pin": 26}}, gpio, publish, window=window)
+    return router, gpio
+
+
+# -------------------------
+# TESTS
+# -------------------------
+def test_commands_coalesced_per_pin():
+    publish = Recorder()
+    router, gpio = make_router(publish, window=0.05)
+    for command in ["ON", "OFF", "ON"]:
+        router.handle("umesh/led/control", command)
+    time.sleep(0.15)
+
+    assert gpio.pins[26] is True
+    assert gpio.writes == 2   # setup to OFF, then one ON
+    assert publish.published == [("umesh/led/status", "ON")]
+
+
+def test_unknown_topic_and_bad_command_ignored():
+    router, gpio = make_router(Recorder())
+    assert not router.handle("umesh/other/control", "ON")
+    assert not router.handle("umesh/led/control", "BLINK")
+
+
+def test_duplicate_pin_rejected():
+    with pytest.raises(ValueError):
+        make_router(Recorder(), led={"pin": 26}, relay={"pin": 26})
+
+
+def test_pwm_brightness():
+    publish = Recorder()
+    router, gpio = make_router(publish, lamp={"pin": 12, "pwm": True})
+    router.handle("umesh/lamp/control", "42.5")
+    router.flush()
+    assert gpio.pwms[12].duty == 42.5
+    assert publish.published == [("umesh/lamp/status", "42.5")]
+
+
+def test_slow_publish_keeps_status_in_pin_order():
+    publish = Recorder(slow_payload="ON", delay=0.1)
+    router, gpio = make_router(publish, window=0.01)
+    router.handle("umesh/led/control", "ON")
+    time.sleep(0.05)   # first flush is now stuck publishing "ON"
+    router.handle("umesh/led/control", "OFF")
+    time.sleep(0.3)
+
+    assert [p for _, p in publish.published] == ["ON", "OFF"]
+    assert gpio.pins[26] is False
+
+
+def test_bad_ts_keeps_command():
+    publish = Recorder()
+    router, gpio = make_router(publish)
+    assert router.handle("umesh/led/control", json.dumps({"cmd": "ON", "id": "x", "ts": "soon"}))
+    router.flush()
+
+    assert gpio.pins[26] is True
+    reply = json.loads(publish.published[0][1])
+    assert reply["ids"] == ["x"] and reply["ts"] is None
+    assert router.latency["inbound"].count == 0
+
+
+def test_reply_echoes_ids_and_records_latency():
+    publish = Recorder()
+    router, gpio = make_router(publish, window=0.05)
+    ts = int(time.time() * 1000)
+    for i, command in enumerate(["ON", "OFF", "ON"]):
+        router.handle("umesh/led/control", json.dumps({"cmd": command, "id": str(i), "ts": ts}))
+    router.flush()
+    router.handle("umesh/led/control", json.dumps({"cmd": "ON", "id": "3"}))
+    router.flush()
+
+    replies = [json.loads(p) for _, p in publish.published]
+    assert [r["ids"] for r in replies] == [["0", "1", "2"], ["3"]]
+    assert all(r["state"] == "ON" for r in replies)
+    # one GPIO write, so one receive->gpio sample; every command gets a status sample
+    assert router.latency["apply"].count == 1
+    assert router.latency["status"].count == 4
+    router.cleanup()
+
+
+def test_bad_cmd_not_sampled():
+    router, gpio = make_router(Recorder())
+    ts = int(time.time() * 1000)
+    assert not router.handle("umesh/led/control", json.dumps({"cmd": "BLINK", "ts": ts}))
+    assert router.latency["inbound"].count == 0
+
+
+def test_arrival_time_from_caller():
+    publish = Recorder()
+    router, gpio = make_router(publish)
+    router.handle("umesh/led/control", json.dumps({"cmd": "ON", "id": "a"}),
+                  received=time.monotonic() - 0.5)
+    router.flush()
+    assert router.latency["apply"].max >= 0.5
+    assert json.loads(publish.published[0][1])["device_ms"] >= 500
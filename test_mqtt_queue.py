@@ -0,0 +1,319 @@
+import shutil
+import socket
+import subprocess
+import threading
+import time
+
+import pytest
+
+from mqtt_queue import DiskQueue, StoreAndForward, MQTT_ERR_SUCCESS
+
+# same value as paho.mqtt.client.MQTT_ERR_NO_CONN
+MQTT_ERR_NO_CONN = 4
+
+
+# -------------------------
+# FAKE PAHO CLIENT
+# -------------------------
+class FakeInfo:
+    def __init__(self, rc, acked):
+        self.rc = rc
+        self.acked = acked
+
+    def is_published(self):
+        return self.acked
+
+
+class FakeClient:
+    """
+    Stands in for a paho client talking to a broker that can be stopped and
+    started.  Like paho under loop_forever, a failed socket write in publish()
+    fires on_disconnect on the calling thread before publish() returns.
+    """
+
+    def __init__(self):
+        self.up = False
+        self.auto_ack = True
+        self.drop_on_publish = False
+        self.received = []
+        self.unacked = []
+        self.on_connect = None
+        self.on_disconnect = None
+
+    def broker_start(self):
+        self.up = True
+        if self.on_connect:
+            self.on_connect(self, None, {}, 0)
+
+    def broker_stop(self):
+        self.up = False
+        if self.on_disconnect:
+            self.on_disconnect(self, None, 1)
+
+    def publish(self, topic, payload, qos=0, retain=False):
+        if self.up and self.drop_on_publish:
+            self.broker_stop()
+        if not self.up:
+            return FakeInfo(MQTT_ERR_NO_CONN, False)
+        info = FakeInfo(MQTT_ERR_SUCCESS, qos == 0 or self.auto_ack)
+        if not info.acked:
+            self.unacked.append(info)
+        self.received.append(payload)
+        return info
+
+    def ack_all(self):
+        for info in self.unacked:
+            info.acked = True
+        self.unacked = []
+
+
+def wire(client, outbox):
+    # same hookup as led_with_mqtt.py
+    client.on_connect = lambda c, userdata, flags, rc: outbox.on_connect()
+    client.on_disconnect = lambda c, userdata, rc: outbox.on_disconnect()
+    return outbox
+
+
+def wait_until(check, timeout=3.0):
+    deadline = time.monotonic() + timeout
+    while not check():
+        if time.monotonic() >= deadline:
+            return False
+        time.sleep(0.01)
+    return True
+
+
+def payloads(queue, limit=1000):
+    return [record["payload"] for record, _ in queue.peek(limit)]
+
+
+# -------------------------
+# DISK QUEUE
+# -------------------------
+def test_cursor_survives_restart(tmp_path):
+    q = DiskQueue(str(tmp_path), segment_bytes=200)
+    for i in range(10):
+        q.append("t", str(i), qos=1)
+    batch = q.peek(4)
+    q.commit(batch[-1][1])
+    q.close()
+
+    q = DiskQueue(str(tmp_path), segment_bytes=200)
+    assert payloads(q) == [str(i) for i in range(4, 10)]
+    q.close()
+
+
+def test_torn_last_line_is_dropped(tmp_path):
+    q = DiskQueue(str(tmp_path))
+    q.append("t", "a")
+    q.append("t", "b")
+    q.close()
+    with open(tmp_path / "00000000.seg", "ab") as f:
+        f.write(b'{"topic":"t","payl')
+
+    q = DiskQueue(str(tmp_path))
+    assert payloads(q) == ["a", "b"]
+    q.append("t", "c")
+    assert payloads(q) == ["a", "b", "c"]
+    q.close()
+
+
+def test_oldest_segment_dropped_when_full(tmp_path):
+    q = DiskQueue(str(tmp_path), segment_bytes=200, max_bytes=1000)
+    for i in range(100):
+        q.append("t", str(i))
+
+    left = payloads(q)
+    assert q.dropped == 100 - len(left)
+    assert left == [str(i) for i in range(100 - len(left), 100)]
+    assert sum(f.stat().st_size for f in tmp_path.glob("*.seg")) <= 1000
+    q.close()
+
+
+def test_fsync_happens_after_interval_without_more_appends(tmp_path):
+    q = DiskQueue(str(tmp_path), fsync_every=1000, fsync_interval=0.05)
+    q.append("t", "a")
+    assert wait_until(lambda: q._unsynced == 0)
+    q.close()
+
+
+def test_bytes_payload_round_trip(tmp_path):
+    q = DiskQueue(str(tmp_path))
+    q.append("t", b"\x00\xffgps")
+    assert payloads(q) == [b"\x00\xffgps"]
+    q.close()
+
+
+# -------------------------
+# STORE AND FORWARD
+# -------------------------
+def test_replay_after_broker_comes_back(tmp_path):
+    client = FakeClient()
+    outbox = wire(client, StoreAndForward(client, DiskQueue(str(tmp_path)), rate=1000))
+
+    outbox.publish("umesh/led/status", "ON", qos=1)
+    outbox.publish("umesh/hcsr04/alert", "12.5", qos=1)
+    outbox.publish("umesh/gps/fix", "1,2", qos=0)
+    assert client.received == []
+
+    client.broker_start()
+    assert wait_until(outbox.queue.empty)
+    assert client.received == ["ON", "12.5", "1,2"]
+
+    # with the backlog gone, publishes go straight through
+    outbox.publish("umesh/led/status", "OFF", qos=1)
+    assert client.received[-1] == "OFF"
+    outbox.queue.close()
+
+
+def test_queue_survives_restart_while_broker_down(tmp_path):
+    client = FakeClient()
+    outbox = wire(client, StoreAndForward(client, DiskQueue(str(tmp_path)), rate=1000))
+    for i in range(5):
+        outbox.publish("t", str(i), qos=1)
+    outbox.queue.close()
+
+    outbox = wire(client, StoreAndForward(client, DiskQueue(str(tmp_path)), rate=1000))
+    client.broker_start()
+    assert wait_until(outbox.queue.empty)
+    assert client.received == [str(i) for i in range(5)]
+    outbox.queue.close()
+
+
+def test_qos1_committed_only_after_ack(tmp_path):
+    client = FakeClient()
+    client.auto_ack = False
+    outbox = wire(client, StoreAndForward(client, DiskQueue(str(tmp_path)), rate=1000,
+                                          ack_timeout=0.05, retry_delay=0.05))
+    outbox.publish("t", "a", qos=1)
+
+    client.broker_start()
+    assert wait_until(lambda: len(client.received) >= 1)
+    time.sleep(0.1)
+    assert not outbox.queue.empty()
+
+    # the broker starts acking again; replay is retried without a reconnect
+    client.auto_ack = True
+    client.ack_all()
+    assert wait_until(outbox.queue.empty)
+    assert set(client.received) == {"a"}
+    outbox.queue.close()
+
+
+def test_disconnect_mid_replay_resends_on_reconnect(tmp_path):
+    client = FakeClient()
+    client.auto_ack = False
+    outbox = wire(client, StoreAndForward(client, DiskQueue(str(tmp_path)), rate=1000,
+                                          ack_timeout=5.0))
+    for i in range(3):
+        outbox.publish("t", str(i), qos=1)
+
+    client.broker_start()
+    assert wait_until(lambda: len(client.received) == 3)
+
+    # broker goes away before acking anything
+    client.broker_stop()
+    assert wait_until(lambda: not outbox._flushing)
+    assert payloads(outbox.queue) == ["0", "1", "2"]
+
+    client.received = []
+    client.auto_ack = True
+    client.broker_start()
+    assert wait_until(outbox.queue.empty)
+    assert client.received == ["0", "1", "2"]
+    outbox.queue.close()
+
+
+def test_disconnect_inside_publish_does_not_deadlock(tmp_path):
+    client = FakeClient()
+    outbox = wire(client, StoreAndForward(client, DiskQueue(str(tmp_path)), rate=1000))
+    client.broker_start()
+
+    # uplink dies during the direct publish; paho calls on_disconnect right there
+    client.drop_on_publish = True
+    worker = threading.Thread(target=outbox.publish, args=("umesh/led/status", "ON", 1))
+    worker.daemon = True
+    worker.start()
+    worker.join(2.0)
+    assert not worker.is_alive()
+    assert payloads(outbox.queue) == ["ON"]
+
+    client.drop_on_publish = False
+    client.broker_start()
+    assert wait_until(outbox.queue.empty)
+    assert client.received == ["ON"]
+    outbox.queue.close()
+
+
+# -------------------------
+# REAL BROKER (paho + mosquitto, skipped when either is missing)
+# -------------------------
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def port_open(port):
+    with socket.socket() as sock:
+        return sock.connect_ex(("127.0.0.1", port)) == 0
+
+
+def start_mosquitto(port):
+    broker = subprocess.Popen([shutil.which("mosquitto"), "-p", str(port)],
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    assert wait_until(lambda: port_open(port), 5.0), "mosquitto did not start"
+    return broker
+
+
+def paho_client(mqtt):
+    if hasattr(mqtt, "CallbackAPIVersion"):   # paho-mqtt >= 2.0
+        return mqtt.Client(mqtt.CallbackAPIVersion.VERSION1)
+    return mqtt.Client()
+
+
+def test_real_broker_stop_and_start(tmp_path):
+    mqtt = pytest.importorskip("paho.mqtt.client")
+    if shutil.which("mosquitto") is None:
+        pytest.skip("mosquitto not installed")
+
+    port = free_port()
+    broker = start_mosquitto(port)
+    publisher = paho_client(mqtt)
+    subscriber = paho_client(mqtt)
+    try:
+        outbox = wire(publisher, StoreAndForward(publisher, DiskQueue(str(tmp_path)), rate=1000))
+        publisher.reconnect_delay_set(min_delay=1, max_delay=1)
+        publisher.connect("127.0.0.1", port, 60)
+        publisher.loop_start()
+        assert wait_until(lambda: outbox._connected, 5.0)
+
+        broker.terminate()
+        broker.wait()
+        assert wait_until(lambda: not outbox._connected, 5.0)
+        for i in range(5):
+            outbox.publish("umesh/test/status", str(i), qos=1)
+        # keep the publisher away until the subscriber is listening
+        publisher.loop_stop()
+
+        broker = start_mosquitto(port)
+        received = []
+        subscribed = threading.Event()
+        subscriber.on_message = lambda c, userdata, msg: received.append(msg.payload.decode())
+        subscriber.on_subscribe = lambda c, userdata, mid, granted: subscribed.set()
+        subscriber.connect("127.0.0.1", port, 60)
+        subscriber.loop_start()
+        subscriber.subscribe("umesh/test/status", qos=1)
+        assert subscribed.wait(5.0)
+
+        publisher.reconnect()
+        publisher.loop_start()
+        assert wait_until(lambda: len(received) >= 5, 10.0)
+        assert received[:5] == [str(i) for i in range(5)]
+        assert wait_until(outbox.queue.empty)
+        outbox.queue.close()
+    finally:
+        publisher.loop_stop()
+        subscriber.loop_stop()
+        broker.terminate()
+        broker.wait()